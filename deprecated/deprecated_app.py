@@ -4,32 +4,49 @@
 # 1. Hierarchy browser of both MONDO and HPO
 # 2. HPOA builder
 # 3. Chatbot interface that can query pubmed for articles, return their HPs and auto-populate HPOA file
-import numpy as np
-import pandas as pd
-import json
-import hpotk
-from hpotk.annotations.load.hpoa import SimpleHpoaDiseaseLoader
 import streamlit as st
 from st_ant_tree import st_ant_tree
-from st_btn_group import st_btn_group
-
-# Build HPO Tree Recursively
-def build_tree(hpo, term_id="HP:0000001", path=""):
-    term = hpo.get_term(term_id)
-    current_path = f"{path}/{term_id}" if path else term_id  # make value path-unique
-
-    children = hpo.graph.get_children(term) or []
-    children_nodes = []
-    for child in children:
-        node = build_tree(hpo, child.value, current_path)
-        if node:
-            children_nodes.append(node)
-
-    return {
-        "label": f"{term.identifier} | {term.name}",
-        "value": current_path,  # unique per path (allows multiple parenthood)
-        "children": children_nodes
-    }
+
+TREE_DEPTH = 2  # levels rendered below the focused term
+
+# Index the HPO DAG with an explicit stack (deep branches would overflow recursion).
+def build_children_index(hpo, term_id="HP:0000001"):
+    get_term = hpo.get_term
+    get_children = hpo.graph.get_children
+
+    # One pass over the DAG: each term is looked up once however many parents it has.
+    children_index = {}
+    work = [term_id]
+    while work:
+        tid = work.pop()
+        if tid in children_index:
+            continue
+        term = get_term(tid)
+        child_ids = [child.value for child in get_children(term) or []]
+        children_index[tid] = (f"{term.identifier} | {term.name}", child_ids)
+        work.extend(child_ids)
+    return children_index
+
+# Build a depth-limited tree under term_id; no ontology lookups.
+def build_tree(children_index, term_id="HP:0000001", max_depth=TREE_DEPTH, path=""):
+    roots = []
+    work = [(term_id, path, 0, roots)]
+    while work:
+        tid, path, depth, siblings = work.pop()
+        label, child_ids = children_index[tid]
+        current_path = f"{path}/{tid}" if path else tid  # make value path-unique
+
+        children_nodes = []
+        siblings.append({
+            "label": label,
+            "value": current_path,  # unique per path (allows multiple parenthood)
+            "children": children_nodes
+        })
+        if depth < max_depth:
+            for child_id in reversed(child_ids):
+                work.append((child_id, current_path, depth + 1, children_nodes))
+
+    return roots[0]
 
 ## Pretty tree viewer
 st.set_page_config(layout="wide")
@@ -41,11 +58,47 @@ def load_minimal_hpo():
     store = hpotk.configure_ontology_store()
     return store.load_minimal_hpo()
 
+# The leading underscore keeps Streamlit from hashing the ontology; it is the
+# cached load_minimal_hpo() singleton, so the index only depends on its identity.
+@st.cache_resource(show_spinner="Indexing HPO...")
+def get_hpo_children_index(_hpo):
+    return build_children_index(_hpo)
+
 hpo = load_minimal_hpo()
-tree = [ build_tree(hpo) ] # must be a list
+children_index = get_hpo_children_index(hpo)
+
+# Only the focused term and TREE_DEPTH levels below it are sent to the browser;
+# st_ant_tree has no lazy-load hook, so deeper levels are reached by refocusing.
+if "focus_path" not in st.session_state:
+    st.session_state.focus_path = ["HP:0000001"]
+
+def descend():
+    child = st.session_state.descend_into
+    if child:
+        st.session_state.focus_path.append(child)
+        st.session_state.descend_into = None
+
+def ascend():
+    if len(st.session_state.focus_path) > 1:
+        st.session_state.focus_path.pop()
+
+focus_path = st.session_state.focus_path
+focus_id = focus_path[-1]
+
+st.caption(" / ".join(children_index[tid][0] for tid in focus_path))
+st.button("Up", on_click=ascend, disabled=len(focus_path) == 1)
+st.selectbox(
+    "Focus on:",
+    [None, *children_index[focus_id][1]],
+    format_func=lambda tid: "" if tid is None else children_index[tid][0],
+    key="descend_into",
+    on_change=descend,
+)
+
+tree = [ build_tree(children_index, focus_id, path="/".join(focus_path[:-1])) ] # must be a list
 
 return_select = st_ant_tree(
     treeData=tree,
     treeCheckable=True
 )
-st.write(return_select)
\ No newline at end of file
+st.write(return_select)
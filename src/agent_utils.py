@@ -0,0 +1,104 @@
+# Helpers for calling the HPOA agent from the Streamlit apps.
+import asyncio
+import httpx
+import openai
+from pydantic_ai.exceptions import ModelHTTPError, UnexpectedModelBehavior
+from pydantic_ai.models.openai import OpenAIChatModel
+from pydantic_ai.providers.openai import OpenAIProvider
+from tenacity import (
+    AsyncRetrying,
+    Retrying,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_exponential,
+)
+from aurelian.agents.hpoa.hpoa_agent import hpoa_agent
+
+def _is_retryable(exc: BaseException) -> bool:
+    # Transport hiccups, rate limits, 5xx and malformed model output are worth
+    # another try; other 4xx (bad key, unknown model, ...) fail immediately.
+    # pydantic-ai only wraps OpenAI status errors; connection failures and
+    # timeouts surface as the SDK's own exceptions.
+    if isinstance(exc, (
+        httpx.TransportError,
+        TimeoutError,
+        openai.APIConnectionError,
+        openai.APITimeoutError,
+        UnexpectedModelBehavior,
+    )):
+        return True
+    if isinstance(exc, ModelHTTPError):
+        return exc.status_code == 429 or exc.status_code >= 500
+    return False
+
+_backoff = wait_exponential(multiplier=0.2, max=2)
+
+def _wait(retry_state) -> float:
+    # Output validation failures are retried straight away; only transport
+    # and server errors back off.
+    if isinstance(retry_state.outcome.exception(), UnexpectedModelBehavior):
+        return 0
+    return _backoff(retry_state)
+
+RETRY_POLICY = dict(
+    retry=retry_if_exception(_is_retryable),
+    stop=stop_after_attempt(3),
+    wait=_wait,
+    reraise=True,
+)
+
+def _without_sdk_retries(model_name: str, client: openai.AsyncOpenAI) -> OpenAIChatModel:
+    # The OpenAI SDK retries 429/5xx itself (twice, with up to 8 s backoff);
+    # turn that off so RETRY_POLICY is the only retry budget in effect.
+    client = client.with_options(max_retries=0)
+    return OpenAIChatModel(model_name, provider=OpenAIProvider(openai_client=client))
+
+def _model_for(agent):
+    """`agent`'s model rebuilt without SDK retries, or None if it is not OpenAI.
+
+    Built per run: it is cheap, and a fresh client is never shared across the
+    event loops that separate `asyncio.run` calls create.
+    """
+    model = agent.model
+    if isinstance(model, str):
+        provider, _, name = model.partition(":")
+        return _without_sdk_retries(name, openai.AsyncOpenAI()) if provider == "openai" else None
+    if isinstance(model, OpenAIChatModel):
+        return _without_sdk_retries(model.model_name, model.client)
+    return None
+
+def run_agent(prompt: str, agent=hpoa_agent):
+    """Run `agent` on `prompt` with a short, bounded retry budget."""
+    model = _model_for(agent)
+    for attempt in Retrying(**RETRY_POLICY):
+        with attempt:
+            return agent.run_sync(prompt, model=model)
+
+def disease_prompt(user_msg: str, disease: str) -> str:
+    """Prompt for one disease in a batch.
+
+    The shared request comes first and the disease last, so every prompt in
+    a batch (after the static system prompt) shares the longest possible
+    prefix for the provider's prompt cache.
+    """
+    return f"{user_msg}\n---\nDisease: {disease}"
+
+async def _run_agent_async(agent, prompt: str, semaphore: asyncio.Semaphore):
+    model = _model_for(agent)
+    async with semaphore:
+        async for attempt in AsyncRetrying(**RETRY_POLICY):
+            with attempt:
+                return await agent.run(prompt, model=model)
+
+async def batch_call_agent(prompts, agent=hpoa_agent, concurrency: int = 16):
+    """Run every prompt through `agent` concurrently, at most `concurrency` in flight.
+
+    Results come back in prompt order; a prompt that still fails after its
+    retries yields its exception in place, so one failure does not discard
+    the others.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    return await asyncio.gather(
+        *(_run_agent_async(agent, prompt, semaphore) for prompt in prompts),
+        return_exceptions=True,
+    )
@@ -9,141 +9,81 @@ from contextlib import contextmanager
 from streamlit_tree_select import tree_select
 import streamlit_antd_components as sac
 from st_ant_tree import st_ant_tree
-from hpotk.model import TermId, MinimalTerm
-from hpotk.ontology import MinimalOntology, create_minimal_ontology
-from hpotk.graph import CsrIndexedGraphFactory
-from hpotk.util import open_text_io_handle_for_reading
-from hpotk.ontology.load.obographs._model import create_node, create_edge, NodeType
-from hpotk.ontology.load.obographs._factory import MinimalTermFactory
 from pydantic_ai import Agent
-import json, re, typing, requests, io
+import asyncio
 from aurelian.agents.hpoa.hpoa_agent import (
     hpoa_simple_agent,
     hpoa_agent,
     hpoa_reasoning_agent,
-    call_agent_with_retry,
     call_agent,
 )
-
-PURL_PATTERN = re.compile(
-    r"http://purl\.obolibrary\.org/obo/(?P<curie>(?P<prefix>\w+)_(?P<id>\w+))"
+from agent_utils import batch_call_agent, disease_prompt, run_agent
+from ontology_utils import (
+    filter_nodes,
+    get_hpo_index,
+    get_hpo_tree,
+    get_mondo_index,
+    get_mondo_tree,
+    load_disease_index,
+    load_disease_rows,
+    load_hpoa_df,
+    load_ontologies,
 )
 
-def extract_curie_from_purl(purl: str) -> typing.Optional[str]:
-    matcher = PURL_PATTERN.match(purl)
-    return matcher.group("curie") if matcher else None
-
-def extract_terms_ontology(nodes, prefixes_of_interest={"MONDO"}):
-    curie_to_term: dict[str, TermId] = {}
-    terms: list[MinimalTerm] = []
-    term_factory = MinimalTermFactory()
-
-    for data in nodes:
-        node = create_node(data)
-        if not node or node.type != NodeType.CLASS:
-            continue
-        curie = extract_curie_from_purl(node.id)
-        if not curie:
-            continue
-        term_id = TermId.from_curie(curie)
-        if term_id.prefix not in prefixes_of_interest:
-            continue
-        curie_to_term[curie] = term_id
-        term = term_factory.create_term(term_id, node)
-        if term:
-            terms.append(term)
-
-    return curie_to_term, terms
-
-def create_edge_list(edges, curie_to_termid):
-    edge_list = []
-    for data in edges:
-        edge = create_edge(data)
-        if edge.pred != "is_a":
-            continue
-        src_curie = extract_curie_from_purl(edge.sub)
-        dest_curie = extract_curie_from_purl(edge.obj)
-        if not src_curie or not dest_curie:
-            continue
-        try:
-            src = curie_to_termid[src_curie]
-            dest = curie_to_termid[dest_curie]
-        except KeyError:
-            continue
-        edge_list.append((src, dest))
-    return edge_list
-
-def load_minimal_ontology(url: str, prefix: str = "MONDO") -> MinimalOntology:
-    with open_text_io_handle_for_reading(url) as fh:
-        doc = json.load(fh)
-
-    obograph = doc["graphs"][0]
-    id_to_term_id, terms = extract_terms_ontology(
-        obograph["nodes"], prefixes_of_interest={prefix}
-    )
-    edges = create_edge_list(obograph["edges"], id_to_term_id)
-    graph = CsrIndexedGraphFactory().create_graph(edges)
-    return create_minimal_ontology(graph, terms, version=None)
-
-# Build HPO Tree Recursively
-def build_tree(ontology, term_id="HP:0000001", path=""):
-    term = ontology.get_term(term_id)
-    term_name = term.name
-    current_path = f"{path}/{term_name+term_id}" if path else term_name + term_id
-
-    children = ontology.graph.get_children(term) or []
-    children_nodes = []
-    for child in children:
-        node = build_tree(ontology, child.value, current_path)
-        if node:
-            children_nodes.append(node)
-
-    return {
-        "label": f"{term.identifier} ({term.name})",
-        "value": current_path,
-        "children": children_nodes,
-    }
-
 # ------------------------------
 # Agent annotation parsing + styling
 # ------------------------------
+AGENT_STATUSES = ["added", "changed", "removed"]
+
 def annotations_to_df(result) -> pd.DataFrame:
-    """Flatten agent annotations into a DataFrame with status + rationale."""
-    if not hasattr(result, "output"):
+    """Flatten agent annotations into a DataFrame with status + rationale.
+
+    `result` is one agent result or a list of them (from `batch_call_agent`).
+    """
+    results = result if isinstance(result, list) else [result]
+    if not any(hasattr(r, "output") for r in results):
         return pd.DataFrame()
 
-    data = result.output
-    if hasattr(data, "model_dump"):
-        annotations = data.model_dump().get("annotations") or []
-    elif isinstance(data, dict):
-        annotations = data.get("annotations", [])
-    else:
-        annotations = []
+    annotations = []
+    for r in results:
+        data = getattr(r, "output", None)
+        if hasattr(data, "model_dump"):
+            annotations.extend(data.model_dump().get("annotations") or [])
+        elif isinstance(data, dict):
+            annotations.extend(data.get("annotations", []))
 
-    rows = []
+    records = []
     for item in annotations:
         if isinstance(item, dict) and "annotation" in item:
-            row = item["annotation"].copy()
-            row["status"] = "removed"
-            row["rationale"] = item.get("rationale", "")
+            records.append((item["annotation"], "removed", item.get("rationale", "")))
         else:
-            row = item.copy()
-            row["status"] = row.get("status", "added")
-            row["rationale"] = row.get("rationale", "")
-        rows.append(row)
+            records.append((item, item.get("status", "added"), item.get("rationale", "")))
+
+    # Build columns directly rather than copying every row dict.
+    keys = dict.fromkeys(k for row, _, _ in records for k in row)
+    keys.pop("status", None)
+    keys.pop("rationale", None)
+    columns = {k: [row.get(k, "") for row, _, _ in records] for k in keys}
+    statuses = [status for _, status, _ in records]
+    columns["status"] = pd.Categorical(
+        statuses,
+        categories=AGENT_STATUSES + sorted(set(statuses).difference(AGENT_STATUSES)),
+    )
+    columns["rationale"] = [rationale for _, _, rationale in records]
+
+    return pd.DataFrame(columns, copy=False)
 
-    return pd.DataFrame(rows)
+STATUS_CSS = {
+    "added": "background-color: #d4f4dd",    # green
+    "changed": "background-color: #fff3cd",  # yellow
+    "removed": "background-color: #f8d7da",  # red
+}
 
 def style_agent_edits(df: pd.DataFrame):
-    def highlight(row):
-        if row["status"] == "added":
-            return ["background-color: #d4f4dd"] * len(row)  # green
-        elif row["status"] == "changed":
-            return ["background-color: #fff3cd"] * len(row)  # yellow
-        elif row["status"] == "removed":
-            return ["background-color: #f8d7da"] * len(row)  # red
-        return [""] * len(row)
-    return df.style.apply(highlight, axis=1)
+    # One map over the status column, broadcast to every column, instead of a
+    # Python callback per row.
+    row_css = df["status"].map(STATUS_CSS).astype(object).fillna("").to_numpy()
+    return df.style.apply(lambda col: row_css, axis=0)
 
 # ------------------------------
 # Style
@@ -151,40 +91,31 @@ def style_agent_edits(df: pd.DataFrame):
 st.set_page_config(layout="wide")
 st.title("HPOA Builder")
 
-@st.cache_resource(show_spinner="Loading HPO...")
-def load_minimal_hpo():
-    url = "https://purl.obolibrary.org/obo/hp.json"
-    return load_minimal_ontology(url, prefix="HP")
-
-hpo = load_minimal_hpo()
-HPO_TREE = [build_tree(hpo)]
-
-@st.cache_resource(show_spinner="Loading MONDO...")
-def load_minimal_mondo():
-    url = "https://purl.obolibrary.org/obo/mondo.json"
-    return load_minimal_ontology(url, prefix="MONDO")
-
-mondo = load_minimal_mondo()
-MONDO_TREE = [build_tree(mondo, term_id="MONDO:0700096")]
-
-@st.cache_resource(show_spinner="Loading HPO Annotations...")
-def load_hpoa_df() -> pd.DataFrame:
-    r = requests.get(
-        "https://api.github.com/repos/obophenotype/human-phenotype-ontology/releases/latest",
-        timeout=20,
-    )
-    r.raise_for_status()
-    url = next(
-        a["browser_download_url"]
-        for a in r.json().get("assets", [])
-        if "phenotype.hpoa" in a.get("browser_download_url", "")
-    )
-    f = requests.get(url, timeout=60)
-    f.raise_for_status()
-    return pd.read_csv(io.StringIO(f.text), sep="\t", comment="#", dtype=str, keep_default_na=False)
+hpo, mondo = load_ontologies()
+HPO_TREE = get_hpo_tree()
+MONDO_TREE = get_mondo_tree()
 
 hpoa_df = load_hpoa_df()
 
+# Searching or switching ontology reruns only this fragment, so the HPOA
+# table and chat history are not rebuilt and re-sent on every search.
+@st.fragment
+def ontology_browser():
+    options = ["HPO", "MONDO"]
+    ontology_choice = st.segmented_control("Select ontology:", options, selection_mode="single")
+
+    if ontology_choice == "HPO":
+        q = st.text_input("Search phenotypic abnormality:", placeholder="Search").lower()
+        filtered = [HPO_TREE[0]] if not q else filter_nodes(hpo, *get_hpo_index(), q)
+        sac.tree(items=filtered, height=500, open_all=True, checkbox=False, show_line=True)
+
+    elif ontology_choice == "MONDO":
+        q = st.text_input("Search disease:", placeholder="Search").lower()
+        filtered = [MONDO_TREE[0]] if not q else filter_nodes(
+            mondo, *get_mondo_index(), q, term_id="MONDO:0700096"
+        )
+        sac.tree(items=filtered, height=500, open_all=True, checkbox=False, show_line=True)
+
 col1, col2 = st.columns([1, 3])
 
 # -------------------
@@ -194,18 +125,7 @@ with col1:
     tab1, tab2 = st.tabs(["Ontology Browser", "Agent"])
 
     with tab1:
-        options = ["HPO", "MONDO"]
-        ontology_choice = st.segmented_control("Select ontology:", options, selection_mode="single")
-
-        if ontology_choice == "HPO":
-            q = st.text_input("Search phenotypic abnormality:", placeholder="Search").lower()
-            filtered = [HPO_TREE[0]] if not q else []
-            selected_hp = sac.tree(items=filtered, height=500, open_all=True, checkbox=False, show_line=True)
-
-        elif ontology_choice == "MONDO":
-            q = st.text_input("Search disease:", placeholder="Search").lower()
-            filtered = [MONDO_TREE[0]] if not q else []
-            selected_mondo = sac.tree(items=filtered, height=500, open_all=True, checkbox=False, show_line=True)
+        ontology_browser()
 
     with tab2:
         if "chat_messages" not in st.session_state:
@@ -223,24 +143,41 @@ with col1:
 
             with st.chat_message("assistant"):
                 with st.spinner("Thinking…"):
-                    try:
-                        reply = call_agent_with_retry(user_msg)
-                        st.session_state.last_agent_result = reply
-                    except Exception as e:
-                        reply = f"Error: {e}"
-                    st.markdown(getattr(reply, "output", str(reply)))
-                    st.session_state.chat_messages.append(("assistant", str(reply)))
+                    picked_diseases = st.session_state.get("picked_diseases") or []
+                    if len(picked_diseases) > 1:
+                        # One request per selected disease, run concurrently;
+                        # failures come back in place of that disease's result.
+                        prompts = [disease_prompt(user_msg, name) for name in picked_diseases]
+                        names = picked_diseases
+                        results = asyncio.run(batch_call_agent(prompts))
+                    else:
+                        names = [None]
+                        try:
+                            results = [run_agent(user_msg)]
+                        except Exception as e:
+                            results = [e]
+
+                    succeeded = [r for r in results if not isinstance(r, BaseException)]
+                    if succeeded:
+                        st.session_state.last_agent_result = succeeded
+
+                    texts = []
+                    for name, r in zip(names, results):
+                        text = f"Error: {r}" if isinstance(r, BaseException) else str(r.output)
+                        texts.append(f"**{name}**\n\n{text}" if name else text)
+                        st.markdown(texts[-1])
+                    st.session_state.chat_messages.append(("assistant", "\n\n".join(texts)))
 
 # -------------------
 # Right column
 # -------------------
 with col2:
     st.header("HPO Annotations")
-    opts = sorted(hpoa_df["disease_name"].dropna().unique())
-    picked = st.multiselect("Select diseases to edit:", options=opts)
+    opts, _ = load_disease_index()
+    picked = st.multiselect("Select diseases to edit:", options=opts, key="picked_diseases")
 
     if picked:
-        copy_df = hpoa_df[hpoa_df["disease_name"].isin(picked)].copy().reset_index(drop=True)
+        view = load_disease_rows(tuple(picked))
 
         if "last_agent_result" in st.session_state:
             agent_df = annotations_to_df(st.session_state.last_agent_result)
@@ -254,22 +191,18 @@ with col2:
             st.dataframe(style_agent_edits(agent_df), width="stretch")
 
             if st.button("Approve Edits"):
-                for _, row in edited.iterrows():
-                    if row["status"] == "removed":
-                        hpoa_df = hpoa_df[
-                            ~(
-                                (hpoa_df["database_id"] == row["database_id"]) &
-                                (hpoa_df["hpo_id"] == row["hpo_id"])
-                            )
-                        ]
-                    else:
-                        hpoa_df = pd.concat(
-                            [hpoa_df, row.drop(["status", "rationale"]).to_frame().T],
-                            ignore_index=True,
-                        )
+                # One anti-join + one concat instead of a copy of hpoa_df per row.
+                removed_mask = edited["status"].eq("removed")
+                drop_keys = edited.loc[removed_mask, ["database_id", "hpo_id"]].drop_duplicates()
+                kept = hpoa_df.merge(
+                    drop_keys, on=["database_id", "hpo_id"], how="left", indicator=True
+                )
+                kept = kept[kept["_merge"].eq("left_only")].drop(columns="_merge")
+                additions = edited.loc[~removed_mask].drop(columns=["status", "rationale"])
+                hpoa_df = pd.concat([kept, additions], ignore_index=True)
                 st.success("Approved agent edits applied!")
         else:
-            edited = st.data_editor(copy_df, hide_index=True, num_rows="dynamic", key="manual_edits")
+            edited = st.data_editor(view, hide_index=True, num_rows="dynamic", key="manual_edits")
             if st.button("Approve Edits"):
                 st.session_state.edited_copy = edited
                 st.success("Edits approved")
@@ -1,7 +1,8 @@
 import streamlit as st
 from typing import Optional
 from aurelian.agents.hpoa.hpoa_config import get_config
-from aurelian.agents.hpoa.hpoa_agent import hpoa_simple_agent, hpoa_agent, hpoa_reasoning_agent, call_agent_with_retry, call_agent
+from aurelian.agents.hpoa.hpoa_agent import hpoa_simple_agent, hpoa_agent, hpoa_reasoning_agent, call_agent
+from agent_utils import run_agent
 import time, json
 
 # initialize session state
@@ -52,7 +53,7 @@ if user_msg:
         with st.spinner("Thinking…"):
             reply = ""
             try:
-                result = call_agent_with_retry(input=user_msg, agent=hpoa_agent)
+                result = run_agent(user_msg, agent=hpoa_agent)
                 data = getattr(result, "output", None) or getattr(result, "data", None)
 
                 if hasattr(data, "model_dump"):
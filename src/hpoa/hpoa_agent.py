@@ -1,5 +1,13 @@
 import os
-import requests
+import bisect
+import functools
+import itertools
+import pickle
+import threading
+import requests_cache
+import diskcache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 from dotenv import load_dotenv
 from pydantic_ai import Agent, RunContext, Tool
@@ -7,15 +15,59 @@ from pydantic import BaseModel, ValidationError, Field
 from typing import Optional, Literal, List
 from oaklib import get_adapter
 from oaklib.datamodels.search import SearchConfiguration
+from oaklib.datamodels.vocabulary import LABEL_PREDICATE, SYNONYM_PREDICATES
+from semsql.sqla.semsql import Statements
 
 load_dotenv()
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OMIM_API_KEY = os.getenv("OMIM_API_KEY")
 
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "hpoa_builder")
+
+# OMIM responses are cached on disk for a week; the API sends no useful cache
+# headers, so expiry is fixed and stale entries are served if OMIM errors.
+OMIM_SESSION = requests_cache.CachedSession(
+    os.path.join(CACHE_DIR, "omim_cache"),
+    backend="sqlite",
+    expire_after=7 * 24 * 60 * 60,
+    cache_control=False,
+    stale_if_error=True,
+    ignored_parameters=["apiKey"],
+)
+# Reuse the TCP+TLS connection to api.omim.org across calls, and retry
+# transient gateway errors before falling back to a stale cache entry.
+OMIM_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504]),
+))
+OMIM_SESSION.headers.update({"Accept": "application/json"})
+
+# Ontology search results survive restarts; keys are normalized labels.
+TOOL_CACHE = diskcache.Cache(os.path.join(CACHE_DIR, "tools"))
+TOOL_CACHE_EXPIRE = 30 * 24 * 60 * 60
+
 # Load Ontologies
-hpo = get_adapter("ontobee:hp")
-mondo = get_adapter("ontobee:mondo")
+# Local SemSQL (SQLite) builds instead of ontobee SPARQL: downloaded once, then
+# every search/label/ancestor query is an indexed local lookup rather than an
+# HTTP round trip. Opened lazily so importing this module stays cheap.
+# pydantic-ai runs sync tools in worker threads, but oaklib's SQL adapters
+# share one session per database, so each adapter is used by one thread at a time.
+_HPO_LOCK = threading.Lock()
+_MONDO_LOCK = threading.Lock()
+
+@functools.cache
+def _hpo():
+    adapter = get_adapter("sqlite:obo:hp")
+    adapter.label("HP:0000001")  # fetch the database now, not mid-tool-call
+    return adapter
+
+@functools.cache
+def _mondo():
+    adapter = get_adapter("sqlite:obo:mondo")
+    adapter.label("MONDO:0000001")
+    return adapter
 
 HPOA_AGENT_PROMPT = (
     """
@@ -56,39 +108,201 @@ HPOA_AGENT_PROMPT = (
 )
 
 # written using ontology-access-kit docs
-def search_hp(label: str) -> List[dict]:
-    """Search the HPO for phenotypic abnormalities, qualifiers, or frequencies."""
-    results = list(hpo.basic_search(label, SearchConfiguration(is_partial=True)))
-    data = []
-    for curie in results:
-        if not curie.startswith("HP:"):
-            continue
-        data.append({
-                "id": curie,
-                "label": hpo.label(curie),
-                "definition": hpo.definition(curie),
-            })
-    return data
+# Search results are memoized on hashable tuples; the tools themselves build
+# fresh dicts so callers can never mutate a cached result.
+_TERM_LABELS: dict = {}       # (adapter name, curie) -> label
+_TERM_DEFINITIONS: dict = {}  # (adapter name, curie) -> definition
+
+def _terms_info(adapter_name: str, curies: List[str]) -> tuple:
+    """(curie, label) for each curie, fetching unseen labels in one batch."""
+    adapter = _hpo() if adapter_name == "hp" else _mondo()
+    missing = [c for c in curies if (adapter_name, c) not in _TERM_LABELS]
+    if missing:
+        labels = dict(adapter.labels(missing))
+        for c in missing:
+            _TERM_LABELS[(adapter_name, c)] = labels.get(c)
+    return tuple((c, _TERM_LABELS[(adapter_name, c)]) for c in curies)
+
+def _terms_definitions(adapter_name: str, curies: List[str]) -> tuple:
+    """Definition for each curie, fetching unseen ones in one batch."""
+    adapter = _hpo() if adapter_name == "hp" else _mondo()
+    missing = [c for c in curies if (adapter_name, c) not in _TERM_DEFINITIONS]
+    if missing:
+        definitions = {d[0]: d[1] for d in adapter.definitions(missing)}
+        for c in missing:
+            _TERM_DEFINITIONS[(adapter_name, c)] = definitions.get(c)
+    return tuple(_TERM_DEFINITIONS[(adapter_name, c)] for c in curies)
+
+def _search_results(adapter_name: str, hits: tuple, include_definition: bool) -> List[dict]:
+    # Definitions are long and rarely needed to pick a term, so they are only
+    # fetched (and sent to the model) on request.
+    results = [{"id": curie, "label": name} for curie, name in hits]
+    if include_definition:
+        definitions = _terms_definitions(adapter_name, [curie for curie, _ in hits])
+        for result, definition in zip(results, definitions):
+            result["definition"] = definition
+    return results
+
+_CURIE_PREFIX = {"hp": "HP:", "mondo": "MONDO:"}
+
+def _build_version(adapter) -> int:
+    # Derived data is keyed on the SQLite file's mtime, so a refreshed
+    # database build gets fresh cache entries.
+    return int(os.path.getmtime(adapter.engine.url.database))
+
+def _build_cache_path(adapter, stem: str) -> str:
+    return os.path.join(CACHE_DIR, f"{stem}_{_build_version(adapter)}.pkl")
+
+@functools.cache
+def _tool_cache_build(tag: str, version: int) -> int:
+    """Evict `tag`'s disk-cached results once if they came from another build."""
+    if TOOL_CACHE.get(("build", tag)) != version:
+        TOOL_CACHE.evict(tag)
+        TOOL_CACHE.set(("build", tag), version)
+    return version
+
+def _dump_pickle(obj, path: str) -> None:
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(f"{path}.tmp", "wb") as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(f"{path}.tmp", path)
+
+@functools.cache
+def _label_index(adapter_name: str) -> dict:
+    """Casefolded label or synonym -> CURIEs, so exact searches skip basic_search.
+
+    Built once per database build and pickled under CACHE_DIR for a fast
+    cold start.
+    """
+    adapter = _hpo() if adapter_name == "hp" else _mondo()
+    path = _build_cache_path(adapter, f"{adapter_name}_labels")
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    # One query over the SemSQL statements table for every label and synonym,
+    # rather than an entity_aliases() query per term.
+    rows = (
+        adapter.session.query(Statements.subject, Statements.predicate, Statements.value)
+        .filter(
+            Statements.predicate.in_([LABEL_PREDICATE, *SYNONYM_PREDICATES]),
+            Statements.subject.like(f"{_CURIE_PREFIX[adapter_name]}%"),
+            Statements.value.isnot(None),
+        )
+        .all()
+    )
+    index: dict = {}  # key -> {curie: None}, an insertion-ordered set
+    # Labels go in first so they rank ahead of synonym hits for the same key.
+    rows.sort(key=lambda row: row[1] != LABEL_PREDICATE)
+    for curie, _, alias in rows:
+        index.setdefault(alias.casefold(), {})[curie] = None
+    index = {key: tuple(hits) for key, hits in index.items()}
+    _dump_pickle(index, path)
+    return index
+
+@functools.cache
+def _sorted_labels(adapter_name: str) -> list:
+    return sorted(_label_index(adapter_name))
+
+def _lookup(adapter_name: str, label: str) -> tuple:
+    """Exact hits for `label`, or prefix hits when it ends in `*`."""
+    key = label.strip().casefold()
+    if not key.endswith("*"):
+        return _label_index(adapter_name).get(key, ())
+    # Sorted keys sharing a prefix are contiguous: bisect to the first one
+    # and walk forward instead of scanning every label.
+    prefix = key.rstrip("*").rstrip()
+    if not prefix:
+        return ()
+    index, keys = _label_index(adapter_name), _sorted_labels(adapter_name)
+    hits = {}
+    for i in range(bisect.bisect_left(keys, prefix), len(keys)):
+        if not keys[i].startswith(prefix):
+            break
+        hits.update(dict.fromkeys(index[keys[i]]))
+    return tuple(hits)
+
+MAX_SEARCH_RESULTS = 50
+PARTIAL_CONF = SearchConfiguration(is_partial=True)  # read-only; shared by every search
+
+def _first_hits(curies, keep) -> List[str]:
+    # Pull from the (lazy) search results only until enough survive the filter.
+    return list(itertools.islice(filter(keep, curies), MAX_SEARCH_RESULTS))
+
+def _is_hp(curie: str) -> bool:
+    return curie.startswith("HP:")
+
+@functools.lru_cache(maxsize=4096)
+def _search_hp(label: str) -> tuple:
+    return _search_hp_build(label, _tool_cache_build("search_hp", _build_version(_hpo())))
+
+# `build` is unused in the body; it puts the database build in the disk-cache
+# key, so results from an older build are never returned (and are evicted on
+# the first search after a refresh).
+@TOOL_CACHE.memoize(name="search_hp", expire=TOOL_CACHE_EXPIRE, tag="search_hp")
+def _search_hp_build(label: str, build: int) -> tuple:
+    hits = _first_hits(_lookup("hp", label), _is_hp)
+    if hits:
+        return _terms_info("hp", hits)
+    results = _hpo().basic_search(label.rstrip("* "), PARTIAL_CONF)
+    return _terms_info("hp", _first_hits(results, _is_hp))
+
+def search_hp(label: str, include_definition: bool = False) -> List[dict]:
+    """Search the HPO for phenotypic abnormalities, qualifiers, or frequencies.
+
+    End the label with `*` (e.g. "cognit*") to match every term or synonym starting with it.
+    Set `include_definition` only when definitions are needed to tell candidates apart.
+    """
+    with _HPO_LOCK:
+        return _search_results("hp", _search_hp(label.strip().casefold()), include_definition)
+
+def get_hp_definition(curie: str) -> Optional[str]:
+    """Get the definition of a single HPO term, e.g. HP:0001249."""
+    with _HPO_LOCK:
+        return _terms_definitions("hp", [curie])[0]
 
 HUMAN_DISEASE_ROOT = "MONDO:0700096"
 
+@functools.cache
+def _human_diseases() -> frozenset:
+    """Every MONDO term under HUMAN_DISEASE_ROOT, computed once per database build."""
+    adapter = _mondo()
+    path = _build_cache_path(adapter, "mondo_human")
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    human = frozenset(adapter.descendants(HUMAN_DISEASE_ROOT))
+    _dump_pickle(human, path)
+    return human
+
 def is_human_disease(curie: str) -> bool:
-    ancestors = set(mondo.ancestors(curie))
-    return HUMAN_DISEASE_ROOT in ancestors
-
-def search_mondo(label: str) -> List[dict]:
-    """Search the MONDO Ontology for disease identifiers."""
-    results = list(mondo.basic_search(label, SearchConfiguration(is_partial=True)))
-    data = []
-    for curie in results:
-        if not is_human_disease(curie):
-            continue
-        data.append({
-            "id" : curie,
-            "label" : mondo.label(curie),
-            "definition": mondo.definition(curie),
-        })
-    return data
+    return curie in _human_diseases()
+
+@functools.lru_cache(maxsize=4096)
+def _search_mondo(label: str) -> tuple:
+    return _search_mondo_build(label, _tool_cache_build("search_mondo", _build_version(_mondo())))
+
+@TOOL_CACHE.memoize(name="search_mondo", expire=TOOL_CACHE_EXPIRE, tag="search_mondo")
+def _search_mondo_build(label: str, build: int) -> tuple:
+    hits = _first_hits(_lookup("mondo", label), is_human_disease)
+    if hits:
+        return _terms_info("mondo", hits)
+    results = _mondo().basic_search(label.rstrip("* "), PARTIAL_CONF)
+    return _terms_info("mondo", _first_hits(results, is_human_disease))
+
+def search_mondo(label: str, include_definition: bool = False) -> List[dict]:
+    """Search the MONDO Ontology for disease identifiers.
+
+    End the label with `*` (e.g. "mucopolysacchar*") to match every term or synonym starting with it.
+    Set `include_definition` only when definitions are needed to tell candidates apart.
+    """
+    with _MONDO_LOCK:
+        return _search_results("mondo", _search_mondo(label.strip().casefold()), include_definition)
+
+def get_mondo_definition(curie: str) -> Optional[str]:
+    """Get the definition of a single MONDO term, e.g. MONDO:0010526."""
+    with _MONDO_LOCK:
+        return _terms_definitions("mondo", [curie])[0]
 
 def get_omim_terms(label: str):
     """Search the OMIM DB for disease identifiers."""
@@ -98,10 +312,7 @@ def get_omim_terms(label: str):
         "format": "json",
         "apiKey": OMIM_API_KEY,
     }
-    headers = {
-        "Accept": "application/json"
-    }
-    response = requests.get(url, params=params, headers=headers)
+    response = OMIM_SESSION.get(url, params=params)
     return response.json()
 
 def get_omim_clinical(label: str):
@@ -113,10 +324,7 @@ def get_omim_clinical(label: str):
         "include": "clinicalSynopsis",
         "apiKey": OMIM_API_KEY,
     }
-    headers = {
-        "Accept": "application/json"
-    }
-    response = requests.get(url, params=params, headers=headers)
+    response = OMIM_SESSION.get(url, params=params)
     return response.json()
 
 class HPOA(BaseModel):
@@ -142,10 +350,11 @@ hpoa_agent = Agent(
     model="openai:gpt-4.1",
     output_type=List[HPOA],
     system_prompt=HPOA_AGENT_PROMPT,
-    tools=[search_hp, search_mondo, get_omim_terms],
+    tools=[search_hp, get_hp_definition, search_mondo, get_mondo_definition, get_omim_terms],
 )
 
-result = hpoa_agent.run_sync("""As opposed to the extensive somatic involvement seen in MPS I, II and VII, all forms of MPS III present with cognitive and neurological impairment with little or no somatic involvement. This disorder may be recognized in childhood by developmental delays, behavioural difficulties, sleep disturbances and dementia. The mental retardation can be profound in patients with severe disease, with a lack of development of social or communicative skills in early childhood. Such patients eventually enter a vegetative state and generally only live into their second or third decade. Some individual patients with MPS III show only mild-to-moderate developmental delays and behavioural problems. It is quite likely that many mildly affected MPS III patients are not recognized in clinical practice.
+if __name__ == "__main__":
+    result = hpoa_agent.run_sync("""As opposed to the extensive somatic involvement seen in MPS I, II and VII, all forms of MPS III present with cognitive and neurological impairment with little or no somatic involvement. This disorder may be recognized in childhood by developmental delays, behavioural difficulties, sleep disturbances and dementia. The mental retardation can be profound in patients with severe disease, with a lack of development of social or communicative skills in early childhood. Such patients eventually enter a vegetative state and generally only live into their second or third decade. Some individual patients with MPS III show only mild-to-moderate developmental delays and behavioural problems. It is quite likely that many mildly affected MPS III patients are not recognized in clinical practice.
 
 Both forms of MPS IV are characterized by a skeletal dysplasia, ligamentous laxity/joint hypermobility, odontoid hypoplasia and short stature, without cognitive impairment. Of interest to the rheumatologist, the skeletal dysplasia is distinct from the dysostosis multiplex seen in MPS I, II and VII. The ligamentous laxity/joint hypermobility associated with MPS IV is also unique among the MPS disorders, since the other disorders with joint involvement present with stiffness and decreased mobility. Neurological involvement, such as cervical spine instability and communicating hydrocephalus, is common in MPS IV and can be life threatening. Patients with severe MPS IV may live into their second or third decade, and those with attenuated disease may live much longer.""")
-print(result.output)
\ No newline at end of file
+    print(result.output)
@@ -0,0 +1,332 @@
+# Ontology and HPOA loading shared by the Streamlit apps.
+# The @st.cache_resource loaders live here so every app run in the same
+# Streamlit process shares one in-memory copy.
+#
+# perf: loaders returning ontologies, trees or DataFrames must use
+# st.cache_resource, never st.cache_data. cache_data hashes arguments and
+# pickles/copies return values on every hit, which for the ~250k-row HPOA
+# table costs more than the work being cached. Derived helpers take no
+# DataFrame arguments; they call the cached loaders instead (or take small
+# hashable keys such as a tuple of disease names).
+import glob, io, json, os, pickle, tempfile, typing
+from concurrent.futures import ThreadPoolExecutor
+import ijson
+import numpy as np
+import pandas as pd
+import requests
+import streamlit as st
+import zstandard as zstd
+from hpotk.model import TermId, MinimalTerm
+from hpotk.ontology import MinimalOntology, create_minimal_ontology
+from hpotk.graph import CsrIndexedGraphFactory
+from hpotk.ontology.load.obographs._model import create_node, create_edge, NodeType
+from hpotk.ontology.load.obographs._factory import MinimalTermFactory
+
+PURL_PREFIX = "http://purl.obolibrary.org/obo/"
+PURL_PREFIX_LEN = len(PURL_PREFIX)
+
+# Called for every node and edge endpoint, so a prefix check instead of a regex.
+# Malformed ids that still contain "_" are rejected later by TermId.from_curie.
+def extract_curie_from_purl(purl: str) -> typing.Optional[str]:
+    if not purl.startswith(PURL_PREFIX):
+        return None
+    curie = purl[PURL_PREFIX_LEN:]
+    return curie if "_" in curie else None
+
+def extract_terms_ontology(nodes, prefixes_of_interest={"MONDO"}):
+    curie_to_term: dict[str, TermId] = {}
+    terms: list[MinimalTerm] = []
+    # Bound to locals: this loop runs once per node of hp.json / mondo.json.
+    _create_node = create_node
+    _from_curie = TermId.from_curie
+    _create_term = MinimalTermFactory().create_term
+    _append = terms.append
+    _NODE_CLASS = NodeType.CLASS
+    _prefix, _prefix_len = PURL_PREFIX, PURL_PREFIX_LEN
+
+    for data in nodes:
+        node = _create_node(data)
+        if not node or node.type is not _NODE_CLASS:
+            continue
+        purl = node.id
+        if not purl.startswith(_prefix):
+            continue
+        curie = purl[_prefix_len:]
+        if "_" not in curie:
+            continue
+        term_id = _from_curie(curie)
+        if term_id.prefix not in prefixes_of_interest:
+            continue
+        curie_to_term[curie] = term_id
+        term = _create_term(term_id, node)
+        if term:
+            _append(term)
+
+    return curie_to_term, terms
+
+def create_edge_list(edges, curie_to_termid):
+    edge_list = []
+    for data in edges:
+        edge = create_edge(data)
+        if edge.pred != "is_a":
+            continue
+        src_curie = extract_curie_from_purl(edge.sub)
+        dest_curie = extract_curie_from_purl(edge.obj)
+        if not src_curie or not dest_curie:
+            continue
+        try:
+            src = curie_to_termid[src_curie]
+            dest = curie_to_termid[dest_curie]
+        except KeyError:
+            continue
+        edge_list.append((src, dest))
+    return edge_list
+
+def download_to_file(url: str, path: str, chunk_size: int = 1 << 20) -> None:
+    with requests.get(url, stream=True, timeout=60) as r:
+        r.raise_for_status()
+        with open(path, "wb") as out:
+            for chunk in r.iter_content(chunk_size):
+                out.write(chunk)
+
+def load_minimal_ontology(url: str, prefix: str = "MONDO") -> MinimalOntology:
+    # Stream nodes and edges with ijson instead of json.load-ing the whole
+    # (>100 MB) document. ijson needs a seekable source to read it twice, so
+    # remote graphs are spooled to a temporary file first.
+    with tempfile.TemporaryDirectory() as tmp:
+        path = url
+        if not os.path.exists(url):
+            path = os.path.join(tmp, "obograph.json")
+            download_to_file(url, path)
+
+        with open(path, "rb") as fh:
+            id_to_term_id, terms = extract_terms_ontology(
+                ijson.items(fh, "graphs.item.nodes.item"), prefixes_of_interest={prefix}
+            )
+        with open(path, "rb") as fh:
+            edges = create_edge_list(ijson.items(fh, "graphs.item.edges.item"), id_to_term_id)
+
+    graph = CsrIndexedGraphFactory().create_graph(edges)
+    return create_minimal_ontology(graph, terms, version=None)
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "hpoa_builder")
+
+def remote_version(url: str) -> typing.Optional[str]:
+    r = requests.head(url, allow_redirects=True, timeout=20)
+    r.raise_for_status()
+    return r.headers.get("ETag") or r.headers.get("Last-Modified")
+
+def load_cached_ontology(url: str, prefix: str = "MONDO") -> MinimalOntology:
+    """`load_minimal_ontology`, persisted to disk across process restarts.
+
+    The pickle is reused while the remote ETag (or Last-Modified) is
+    unchanged, or when the remote cannot be reached. A remote that sends
+    neither header cannot be validated, so it is re-downloaded each time.
+    """
+    cache_path = os.path.join(CACHE_DIR, f"{prefix}.pkl.zst")
+    meta_path = os.path.join(CACHE_DIR, f"{prefix}.meta.json")
+
+    try:
+        version = remote_version(url)
+        reachable = True
+    except requests.RequestException:
+        version, reachable = None, False
+
+    if os.path.exists(cache_path) and os.path.exists(meta_path):
+        with open(meta_path) as fh:
+            stored = json.load(fh).get("version")
+        if not reachable or (version is not None and version == stored):
+            with zstd.open(cache_path, "rb") as fh:
+                return pickle.load(fh)
+
+    ontology = load_minimal_ontology(url, prefix)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with zstd.open(cache_path + ".tmp", "wb") as fh:
+        pickle.dump(ontology, fh, protocol=pickle.HIGHEST_PROTOCOL)
+    with open(meta_path + ".tmp", "w") as fh:
+        json.dump({"url": url, "version": version}, fh)
+    # Drop the old metadata first: a crash part-way through leaves no pair
+    # (a cache miss), never a new pickle next to stale metadata.
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    os.replace(cache_path + ".tmp", cache_path)
+    os.replace(meta_path + ".tmp", meta_path)
+    return ontology
+
+def index_subtree(ontology, term_id="HP:0000001"):
+    """Map every term below `term_id` to (label, path segment, child ids).
+
+    HPO/MONDO are DAGs, so a term reached through several parents is resolved
+    only once here instead of once per path.
+    """
+    get_term = ontology.get_term
+    get_children = ontology.graph.get_children
+
+    index = {}
+    work = [term_id]
+    while work:
+        tid = work.pop()
+        if tid in index:
+            continue
+        term = get_term(tid)
+        child_ids = [child.value for child in get_children(term) or []]
+        index[tid] = (f"{term.identifier} ({term.name})", term.name + tid, child_ids)
+        work.extend(child_ids)
+    return index
+
+# Build HPO Tree with an explicit stack (deep MONDO branches overflow recursion)
+def build_tree(index, term_id="HP:0000001", keep=None):
+    """Emit the path-qualified tree from an `index_subtree` index.
+
+    If `keep` is given, only terms in that set are emitted.
+    """
+    roots = []
+    # (term_id, parent_path, parent's children list); children are pushed in
+    # reverse so siblings come off the stack in ontology order.
+    work = [(term_id, "", roots)]
+    while work:
+        tid, path, siblings = work.pop()
+        label, segment, child_ids = index[tid]
+        current_path = f"{path}/{segment}" if path else segment
+
+        children_nodes = []
+        siblings.append({
+            "label": label,
+            "value": current_path,
+            "children": children_nodes,
+        })
+        for child_id in reversed(child_ids):
+            if keep is None or child_id in keep:
+                work.append((child_id, current_path, children_nodes))
+
+    return roots[0]
+
+def filter_nodes(ontology, index, labels, q, term_id="HP:0000001"):
+    """Tree of the terms whose lowercased label contains `q`, plus their ancestors."""
+    matches = [tid for tid, label in labels if q in label]
+    if not matches:
+        return []
+
+    get_parents = ontology.graph.get_parents
+    keep = set(matches)
+    work = [TermId.from_curie(tid) for tid in matches]
+    while work:
+        for parent in get_parents(work.pop()):
+            if parent.value not in keep:
+                keep.add(parent.value)
+                work.append(parent)
+
+    return [build_tree(index, term_id, keep)] if term_id in keep else []
+
+def compact_dtypes(df: pd.DataFrame, max_category_ratio: float = 0.5) -> pd.DataFrame:
+    """Store repetitive string columns as category and the rest as Arrow strings."""
+    n_rows = max(len(df), 1)
+    return df.astype({
+        col: "category" if df[col].nunique() / n_rows <= max_category_ratio else "string[pyarrow]"
+        for col in df.columns
+    })
+
+HPO_URL = "https://purl.obolibrary.org/obo/hp.json"
+MONDO_URL = "https://purl.obolibrary.org/obo/mondo.json"
+
+@st.cache_resource(show_spinner="Loading HPO and MONDO...")
+def load_ontologies():
+    # Fetch and parse both ontologies side by side rather than one after the other.
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        hpo_future = executor.submit(load_cached_ontology, HPO_URL, "HP")
+        mondo_future = executor.submit(load_cached_ontology, MONDO_URL, "MONDO")
+        return hpo_future.result(), mondo_future.result()
+
+def load_minimal_hpo():
+    return load_ontologies()[0]
+
+def load_minimal_mondo():
+    return load_ontologies()[1]
+
+@st.cache_resource(show_spinner="Indexing HPO...")
+def get_hpo_index():
+    index = index_subtree(load_minimal_hpo())
+    labels = [(tid, label.lower()) for tid, (label, _, _) in index.items()]
+    return index, labels
+
+@st.cache_resource(show_spinner="Building HPO tree...")
+def get_hpo_tree():
+    index, _ = get_hpo_index()
+    return [build_tree(index)]
+
+@st.cache_resource(show_spinner="Indexing MONDO...")
+def get_mondo_index():
+    index = index_subtree(load_minimal_mondo(), term_id="MONDO:0700096")
+    labels = [(tid, label.lower()) for tid, (label, _, _) in index.items()]
+    return index, labels
+
+@st.cache_resource(show_spinner="Building MONDO tree...")
+def get_mondo_tree():
+    index, _ = get_mondo_index()
+    return [build_tree(index, term_id="MONDO:0700096")]
+
+def read_hpoa_parquet(path: str) -> pd.DataFrame:
+    # Categories survive the Parquet round trip, but Arrow-backed strings come
+    # back as python-backed "string"; restore the compact_dtypes storage.
+    df = pd.read_parquet(path, engine="pyarrow")
+    return df.astype({
+        col: "string[pyarrow]"
+        for col, dtype in df.dtypes.items()
+        if isinstance(dtype, pd.StringDtype) and dtype.storage != "pyarrow"
+    })
+
+@st.cache_resource(show_spinner="Loading HPO Annotations...")
+def load_hpoa_df() -> pd.DataFrame:
+    # Each release is parsed from TSV once and kept as zstd Parquet, which
+    # reloads much faster than re-parsing the TSV.
+    try:
+        r = requests.get(
+            "https://api.github.com/repos/obophenotype/human-phenotype-ontology/releases/latest",
+            timeout=20,
+        )
+        r.raise_for_status()
+    except requests.RequestException:
+        cached = sorted(glob.glob(os.path.join(CACHE_DIR, "hpoa_*.parquet")))
+        if not cached:
+            raise
+        return read_hpoa_parquet(cached[-1])
+
+    release = r.json()
+    cache_path = os.path.join(CACHE_DIR, f"hpoa_{release.get('tag_name', 'latest')}.parquet")
+    if os.path.exists(cache_path):
+        return read_hpoa_parquet(cache_path)
+
+    url = next(
+        a["browser_download_url"]
+        for a in release.get("assets", [])
+        if "phenotype.hpoa" in a.get("browser_download_url", "")
+    )
+    f = requests.get(url, timeout=60)
+    f.raise_for_status()
+    df = pd.read_csv(io.StringIO(f.text), sep="\t", comment="#", dtype=str, keep_default_na=False)
+    df = compact_dtypes(df)
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = cache_path + ".tmp"
+    df.to_parquet(tmp_path, engine="pyarrow", compression="zstd", index=False)
+    os.replace(tmp_path, cache_path)
+    return df
+
+@st.cache_resource
+def load_disease_index():
+    """Sorted disease names and each name's row positions in `load_hpoa_df()`."""
+    rows_by_disease = load_hpoa_df().groupby("disease_name", observed=True).indices
+    return sorted(rows_by_disease), rows_by_disease
+
+@st.cache_resource(max_entries=64)
+def load_disease_rows(picked: tuple) -> pd.DataFrame:
+    """HPOA rows for the picked diseases, as plain strings for the data editor.
+
+    st.data_editor returns a new frame, so the cached slice is never mutated.
+    """
+    _, rows_by_disease = load_disease_index()
+    rows = np.sort(np.concatenate([rows_by_disease[name] for name in picked]))
+    # Plain strings so edits are not limited to the existing categories.
+    view = load_hpoa_df().iloc[rows].astype(str)
+    view.reset_index(drop=True, inplace=True)
+    return view